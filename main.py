@@ -20,7 +20,6 @@ from config import (
 )
 from src.combiner import merge_logs_to_file
 from src.logging_setup import configure_logging
-from src.parsers import iter_inventory_events, iter_money_events
 from src.report import load_items_catalog, write_statistics, interactive_loop
 from src.state import PlayerRegistry, GameState
 
@@ -34,17 +33,12 @@ def run_pipeline(interactive=True):
     configure_logging()
     logger.info("Запуск конвейера обработки логов")
 
-    logger.info("Слияние инвентарных и денежных логов в %s", COMBINED_LOG_PATH)
-    merge_logs_to_file(INVENTORY_LOG_PATH, MONEY_LOG_PATH, COMBINED_LOG_PATH)
-
-    logger.info("Построение состояния игроков и предметов")
+    logger.info(
+        "Слияние логов в %s с одновременным построением состояния", COMBINED_LOG_PATH
+    )
     registry = PlayerRegistry.from_db_file(PLAYER_DB_PATH)
     state = GameState(registry)
-
-    for event in iter_inventory_events(INVENTORY_LOG_PATH):
-        state.apply_inventory_event(event)
-    for event in iter_money_events(MONEY_LOG_PATH):
-        state.apply_money_event(event)
+    merge_logs_to_file(INVENTORY_LOG_PATH, MONEY_LOG_PATH, COMBINED_LOG_PATH, state=state)
 
     catalog = load_items_catalog(ITEMS_XML_PATH)
     logger.info("Формирование статистики в %s", OUTPUT_STATS_PATH)
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Общий форматтер временных меток для модулей слияния и отчётов.
+
+Готовые строки кэшируются по целочисленному timestamp: соседние события в
+логах часто приходятся на одну и ту же секунду, поэтому доля попаданий в кэш
+высока и дорогой вызов ``datetime.utcfromtimestamp`` + ``strftime`` на каждое
+событие не выполняется.
+"""
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+
+# Ограничение размера кэша: защищает от неограниченного роста на логах с
+# миллионами уникальных секунд.
+_CACHE_LIMIT = 4096
+_cache = {}
+
+
+def format_timestamp(timestamp):
+    """Преобразовать целочисленный timestamp в строку ``YY-MM-DD HH:MM:SS``."""
+
+    cached = _cache.get(timestamp)
+    if cached is not None:
+        return cached
+
+    text = datetime.utcfromtimestamp(timestamp).strftime("%y-%m-%d %H:%M:%S")
+    if len(_cache) >= _CACHE_LIMIT:
+        _cache.clear()
+    _cache[timestamp] = text
+    return text
+
+
+__all__ = ["format_timestamp"]
@@ -7,51 +7,114 @@
 """
 from __future__ import unicode_literals
 
-import heapq
 import logging
-from datetime import datetime
+from threading import Thread
 
-from parsers import iter_inventory_events, iter_money_events
+try:
+    from Queue import Queue
+except ImportError:  # pragma: no cover - Python 3 fallback
+    from queue import Queue
+
+from _timefmt import format_timestamp
+from parsers import ACTION_NAMES, iter_inventory_batches, iter_money_batches
 
 
 logger = logging.getLogger(__name__)
 
+# Объём отформатированного текста (в символах), накапливаемый перед сбросом
+# на диск: крупные порции сокращают число системных вызовов записи.
+_WRITE_BUFFER_LIMIT = 1 << 20
 
-def _format_timestamp(timestamp):
-    """Преобразовать целочисленный timestamp в строку ``[YY-MM-DD HH:MM:SS]``."""
+# Глубина очередей между потоками-производителями и потребителем слияния:
+# ограничивает память несколькими пакетами событий на каждый источник.
+_QUEUE_DEPTH = 8
 
-    dt = datetime.utcfromtimestamp(timestamp)
-    return dt.strftime("%y-%m-%d %H:%M:%S")
 
+def _append_inventory_event(buf, event):
+    """Добавить отформатированное событие инвентаря в байтовый буфер вывода.
 
-def format_inventory_event(event):
-    """Сформатировать строку для события инвентаря."""
+    Части строки дописываются в долгоживущий ``bytearray`` без промежуточной
+    склейки, поэтому на горячем пути слияния не создаётся объект полной строки
+    на каждое событие.
+    """
 
-    ts = _format_timestamp(event.timestamp)
-    items = ["(%d, %d)" % (item_type_id, amount) for item_type_id, amount in event.items]
-    return "[%s] %d | %s %s" % (ts, event.player_id, event.action, " ".join(items))
+    buf += b"[%s] %d | %s " % (
+        format_timestamp(event.timestamp),
+        event.player_id,
+        ACTION_NAMES[event.action],
+    )
+    buf += b" ".join([b"(%d, %d)" % pair for pair in event.items])
+    buf += b"\n"
 
 
-def format_money_event(event):
-    """Сформатировать строку для денежного события."""
+def _append_money_event(buf, event):
+    """Добавить отформатированное денежное событие в байтовый буфер вывода."""
 
-    ts = _format_timestamp(event.timestamp)
-    return "[%s] %d | %s | %d | %s" % (
-        ts,
+    buf += b"[%s] %d | %s | %d | %s\n" % (
+        format_timestamp(event.timestamp),
         event.player_id,
-        event.action,
+        ACTION_NAMES[event.action],
         event.amount,
         event.reason,
     )
 
 
-def merge_logs_to_file(inventory_path, money_path, output_path, log=None):
+def _produce_batches(batch_source, path, queue, log, errors):
+    """Поток-производитель: читает и парсит лог, складывая пакеты в очередь.
+
+    Завершение потока помечается сентинелом ``None``; исключения чтения
+    сохраняются в ``errors`` и повторно поднимаются потребителем.
+    """
+
+    try:
+        for batch in batch_source(path, log=log):
+            queue.put(batch)
+    except BaseException as exc:  # noqa: B036 - пробрасывается потребителю
+        errors.append(exc)
+    finally:
+        queue.put(None)
+
+
+def _iter_queue_events(queue):
+    """Разворачивать пакеты событий из очереди в поток отдельных событий."""
+
+    while True:
+        batch = queue.get()
+        if batch is None:
+            return
+        for event in batch:
+            yield event
+
+
+def format_inventory_event(event):
+    """Сформатировать строку для события инвентаря."""
+
+    buf = bytearray()
+    _append_inventory_event(buf, event)
+    return bytes(buf[:-1])
+
+
+def format_money_event(event):
+    """Сформатировать строку для денежного события."""
+
+    buf = bytearray()
+    _append_money_event(buf, event)
+    return bytes(buf[:-1])
+
+
+def merge_logs_to_file(inventory_path, money_path, output_path, state=None, log=None):
     """Объединить логи предметов и денег в комбинированный файл.
 
     Чтение выполняется потоково: в памяти одновременно находятся только по одной
-    записи из каждого источника. При одинаковом времени события инвентаря имеют
-    более высокий приоритет. Порядок в рамках каждого файла сохраняется за счёт
-    дополнительного счётчика.
+    записи из каждого источника. Источников ровно два, поэтому вместо кучи
+    используется прямое двухуказательное слияние: на каждом шаге сравниваются
+    только текущие события обоих потоков. При одинаковом времени события
+    инвентаря имеют более высокий приоритет, порядок внутри каждого файла
+    сохраняется автоматически.
+
+    Если передан ``state`` (``GameState``), события дополнительно применяются
+    к нему прямо в цикле слияния — в хронологическом порядке и без повторного
+    чтения и разбора исходных файлов.
     """
 
     active_logger = log or logger
@@ -61,76 +124,86 @@ def merge_logs_to_file(inventory_path, money_path, output_path, log=None):
         money_path,
         output_path,
     )
-    inventory_iter = iter_inventory_events(inventory_path, log=active_logger)
-    money_iter = iter_money_events(money_path, log=active_logger)
-
-    heap = []
-    inventory_order = 0
-    money_order = 0
-
-    try:
-        first_inv = next(inventory_iter)
-    except StopIteration:
-        first_inv = None
-    if first_inv is not None:
-        heapq.heappush(heap, (first_inv.timestamp, 0, inventory_order, "inventory", first_inv))
-        inventory_order += 1
-
-    try:
-        first_money = next(money_iter)
-    except StopIteration:
-        first_money = None
-    if first_money is not None:
-        heapq.heappush(heap, (first_money.timestamp, 1, money_order, "money", first_money))
-        money_order += 1
+    # Чтение и разбор обоих логов выполняются в фоновых потоках: операции
+    # ввода-вывода отпускают GIL, поэтому разбор перекрывается с чтением,
+    # а слияние в основном потоке получает уже готовые пакеты событий.
+    inv_queue = Queue(maxsize=_QUEUE_DEPTH)
+    money_queue = Queue(maxsize=_QUEUE_DEPTH)
+    producer_errors = []
+    producers = [
+        Thread(
+            target=_produce_batches,
+            args=(iter_inventory_batches, inventory_path, inv_queue,
+                  active_logger, producer_errors),
+            name="inventory-producer",
+        ),
+        Thread(
+            target=_produce_batches,
+            args=(iter_money_batches, money_path, money_queue,
+                  active_logger, producer_errors),
+            name="money-producer",
+        ),
+    ]
+    for producer in producers:
+        producer.daemon = True
+        producer.start()
+
+    inventory_iter = _iter_queue_events(inv_queue)
+    money_iter = _iter_queue_events(money_queue)
+
+    inv_event = next(inventory_iter, None)
+    money_event = next(money_iter, None)
 
     inventory_count = 0
     money_count = 0
-    with open(output_path, "w") as handle:
-        while heap:
-            _, _, _, source, event = heapq.heappop(heap)
-            if source == "inventory":
-                line = format_inventory_event(event)
+    # Долгоживущий байтовый буфер вывода: переиспользуется между сбросами,
+    # чтобы не создавать новый контейнер на каждую порцию записей.
+    buf = bytearray()
+    with open(output_path, "w", _WRITE_BUFFER_LIMIT) as handle:
+        while inv_event is not None and money_event is not None:
+            if inv_event.timestamp <= money_event.timestamp:
+                _append_inventory_event(buf, inv_event)
+                if state is not None:
+                    state.apply_inventory_event(inv_event)
                 inventory_count += 1
+                inv_event = next(inventory_iter, None)
             else:
-                line = format_money_event(event)
+                _append_money_event(buf, money_event)
+                if state is not None:
+                    state.apply_money_event(money_event)
                 money_count += 1
-            handle.write(line + "\n")
-
-            if source == "inventory":
-                try:
-                    next_event = next(inventory_iter)
-                except StopIteration:
-                    next_event = None
-                if next_event is not None:
-                    heapq.heappush(
-                        heap,
-                        (
-                            next_event.timestamp,
-                            0,
-                            inventory_order,
-                            "inventory",
-                            next_event,
-                        ),
-                    )
-                    inventory_order += 1
-            else:
-                try:
-                    next_event = next(money_iter)
-                except StopIteration:
-                    next_event = None
-                if next_event is not None:
-                    heapq.heappush(
-                        heap,
-                        (
-                            next_event.timestamp,
-                            1,
-                            money_order,
-                            "money",
-                            next_event,
-                        ),
-                    )
-                    money_order += 1
+                money_event = next(money_iter, None)
+            if len(buf) >= _WRITE_BUFFER_LIMIT:
+                handle.write(buf)
+                del buf[:]
+
+        while inv_event is not None:
+            _append_inventory_event(buf, inv_event)
+            if state is not None:
+                state.apply_inventory_event(inv_event)
+            inventory_count += 1
+            inv_event = next(inventory_iter, None)
+            if len(buf) >= _WRITE_BUFFER_LIMIT:
+                handle.write(buf)
+                del buf[:]
+
+        while money_event is not None:
+            _append_money_event(buf, money_event)
+            if state is not None:
+                state.apply_money_event(money_event)
+            money_count += 1
+            money_event = next(money_iter, None)
+            if len(buf) >= _WRITE_BUFFER_LIMIT:
+                handle.write(buf)
+                del buf[:]
+
+        if buf:
+            handle.write(buf)
+
+    for producer in producers:
+        producer.join()
+    if producer_errors:
+        raise producer_errors[0]
 
     active_logger.info(
         "Слияние завершено: %d событий инвентаря, %d событий денег, всего %d",
@@ -10,14 +10,24 @@ import os
 from config import LOG_FILE_PATH
 
 
+# Флаг конфигурации по умолчанию: повторные вызовы со стандартным путём
+# завершаются мгновенно, без сканирования обработчиков и syscalls abspath.
+_CONFIGURED = False
+
+
 def configure_logging(level=logging.INFO, log_path=None):
     """Сконфигурировать корневой логгер.
 
     По умолчанию пишет в ``app.log`` в корне репозитория и дублирует вывод в
-    stdout. При повторном вызове дополнительные обработчики не добавляются,
-    если уже есть конфигурированный корневой логгер.
+    stdout. При повторном вызове дополнительные обработчики не добавляются:
+    для пути по умолчанию срабатывает константный флаг, при явном ``log_path``
+    выполняется прежняя проверка существующих обработчиков.
     """
 
+    global _CONFIGURED
+    if _CONFIGURED and log_path is None:
+        return
+
     path = log_path or LOG_FILE_PATH
 
     if os.path.isdir(path):
@@ -55,4 +65,7 @@ def configure_logging(level=logging.INFO, log_path=None):
         stream_handler.setFormatter(formatter)
         root.addHandler(stream_handler)
 
+    if log_path is None:
+        _CONFIGURED = True
+
 __all__ = ["configure_logging"]
\ No newline at end of file
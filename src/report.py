@@ -7,10 +7,13 @@
 """
 from __future__ import unicode_literals
 
+import heapq
 import io
 import logging
 import sys
-from datetime import datetime
+
+from _timefmt import format_timestamp
+from state import NO_ACTIVITY_TS
 
 try:
     text_type = unicode  # type: ignore[name-defined]
@@ -32,57 +35,63 @@ def _to_text(value):
 
 
 def _write_table(handle, headers, rows, padding=2):
-    """Вывести простую таблицу с выравниванием колонок."""
+    """Вывести простую таблицу с выравниванием колонок.
+
+    Ячейки конвертируются в текст ровно один раз: сначала строится текстовая
+    сетка, по ней вычисляются ширины колонок, затем те же строки используются
+    при выводе.
+    """
 
-    widths = [len(_to_text(h)) for h in headers]
-    for row in rows:
+    text_headers = [_to_text(h) for h in headers]
+    text_rows = [[_to_text(cell) for cell in row] for row in rows]
+
+    widths = [len(h) for h in text_headers]
+    for row in text_rows:
         for idx, cell in enumerate(row):
-            widths[idx] = max(widths[idx], len(_to_text(cell)))
+            if len(cell) > widths[idx]:
+                widths[idx] = len(cell)
+
+    separator = " " * padding
 
     def _format_row(row_values):
-        parts = []
-        for idx, cell in enumerate(row_values):
-            text = _to_text(cell)
-            parts.append(text.ljust(widths[idx]))
-        return (" " * padding).join(parts)
+        return separator.join(
+            cell.ljust(widths[idx]) for idx, cell in enumerate(row_values)
+        )
 
-    handle.write(_format_row(headers) + "\n")
+    handle.write(_format_row(text_headers) + "\n")
     handle.write("-" * (sum(widths) + padding * (len(headers) - 1)) + "\n")
-    for row in rows:
+    for row in text_rows:
         handle.write(_format_row(row) + "\n")
     handle.write("\n")
 from xml.etree import ElementTree
 
 
-def _format_timestamp(timestamp):
-    """Вернуть строковое представление времени ``[YY-MM-DD HH:MM:SS]``."""
-
-    dt = datetime.utcfromtimestamp(timestamp)
-    return dt.strftime("%y-%m-%d %H:%M:%S")
-
-
 def load_items_catalog(path):
     """Загрузить названия предметов из ``items.xml`` в словарь ``id → name``."""
 
     logger.info("Загрузка каталога предметов из %s", path)
-    tree = ElementTree.parse(path)
-    root = tree.getroot()
     catalog = {}
-    for item in root.findall("item"):
-        item_id_node = item.find("item_type_id")
-        name_node = item.find("item_name")
-        if item_id_node is None or item_id_node.text is None:
-            continue
-        try:
-            item_id = int(item_id_node.text)
-        except (TypeError, ValueError):
+    for _, elem in ElementTree.iterparse(path, events=("end",)):
+        if elem.tag != "item":
             continue
 
-        name = None
-        if name_node is not None and name_node.text is not None:
-            name = name_node.text.strip()
+        item_id_node = elem.find("item_type_id")
+        name_node = elem.find("item_name")
+
+        item_id = None
+        if item_id_node is not None and item_id_node.text is not None:
+            try:
+                item_id = int(item_id_node.text)
+            except (TypeError, ValueError):
+                item_id = None
+
+        if item_id is not None:
+            name = None
+            if name_node is not None and name_node.text is not None:
+                name = name_node.text.strip()
+            catalog[item_id] = name or "unknown"
 
-        catalog[item_id] = name or "unknown"
+        elem.clear()
     logger.info("Каталог загружен: %d предметов", len(catalog))
     return catalog
 
@@ -96,21 +105,25 @@ def _item_name(item_type_id, catalog):
 def _top_items_by_mentions(item_stats, catalog, limit=10):
     """Подготовить топ предметов по количеству упоминаний в логах."""
 
-    ranked = sorted(
-        item_stats.mentions.items(), key=lambda pair: (-pair[1], pair[0])
+    ranked = heapq.nsmallest(
+        limit, item_stats.iter_mentions(), key=lambda pair: (-pair[1], pair[0])
     )
     result = []
-    for item_type_id, count in ranked[:limit]:
+    for item_type_id, count in ranked:
         result.append((item_type_id, _item_name(item_type_id, catalog), count))
     return result
 
 
-def _top_players_by_money(players, limit=10):
-    """Отсортировать игроков по итоговому балансу денег."""
+def _top_players_by_money(active_players, limit=10):
+    """Отсортировать игроков по итоговому балансу денег.
 
-    active_players = [p for p in players if p.first_event_ts is not None]
-    ordered = sorted(active_players, key=lambda p: (-p.money, p.player_id))
-    return ordered[:limit]
+    Ожидает уже отфильтрованный список игроков с событиями: фильтрация
+    выполняется один раз в ``write_statistics``, а не при каждом вызове.
+    """
+
+    return heapq.nsmallest(
+        limit, active_players, key=lambda p: (-p.money, p.player_id)
+    )
 
 
 def _first_items(item_stats, catalog, limit=10):
@@ -139,7 +152,7 @@ def _write_top_items(handle, game_state, catalog):
     for idx, (item_type_id, name, count) in enumerate(
         _top_items_by_mentions(game_state.item_stats, catalog), start=1
     ):
-        owners = game_state.item_stats.owner_counts.get(item_type_id, 0)
+        owners = game_state.item_stats.get_owner_count(item_type_id)
         rows.append((idx, name, item_type_id, count, owners))
 
     _write_table(
@@ -149,21 +162,21 @@ def _write_top_items(handle, game_state, catalog):
     )
 
 
-def _write_top_players(handle, game_state):
+def _write_top_players(handle, active_players):
     """Сериализовать топ игроков по балансу с датами активности."""
 
     handle.write("Топ 10 игроков по количеству денег после всех операций:\n")
     rows = []
     for idx, player in enumerate(
-        _top_players_by_money(game_state.players.values()), start=1
+        _top_players_by_money(active_players), start=1
     ):
         first_ts = (
-            _format_timestamp(player.first_event_ts)
-            if player.first_event_ts is not None
+            format_timestamp(player.first_event_ts)
+            if player.first_event_ts != NO_ACTIVITY_TS
             else "N/A"
         )
         last_ts = (
-            _format_timestamp(player.last_event_ts)
+            format_timestamp(player.last_event_ts)
             if player.last_event_ts is not None
             else "N/A"
         )
@@ -184,7 +197,7 @@ def _write_first_items(handle, game_state, catalog):
     for idx, (item_type_id, name, timestamp) in enumerate(
         _first_items(game_state.item_stats, catalog), start=1
     ):
-        rows.append((idx, name, item_type_id, _format_timestamp(timestamp)))
+        rows.append((idx, name, item_type_id, format_timestamp(timestamp)))
 
     _write_table(
         handle,
@@ -201,7 +214,7 @@ def _write_last_items(handle, game_state, catalog):
     for idx, (item_type_id, name, timestamp) in enumerate(
         _last_items(game_state.item_stats, catalog), start=1
     ):
-        rows.append((idx, name, item_type_id, _format_timestamp(timestamp)))
+        rows.append((idx, name, item_type_id, format_timestamp(timestamp)))
 
     _write_table(
         handle,
@@ -213,15 +226,17 @@ def _write_last_items(handle, game_state, catalog):
 def write_statistics(game_state, catalog, output_path):
     """Записать файл ``output.txt`` с четырьмя блоками статистики."""
 
+    players_list = list(game_state.players.values())
+    active_players = [p for p in players_list if p.first_event_ts != NO_ACTIVITY_TS]
     logger.info(
         "Формирование статистики: игроков=%d, предметов=%d, файл=%s",
-        len(game_state.players.values()),
-        len(game_state.item_stats.totals),
+        len(players_list),
+        game_state.item_stats.distinct_items(),
         output_path,
     )
     with io.open(output_path, "w", encoding="utf-8") as handle:
         _write_top_items(handle, game_state, catalog)
-        _write_top_players(handle, game_state)
+        _write_top_players(handle, active_players)
         _write_first_items(handle, game_state, catalog)
         _write_last_items(handle, game_state, catalog)
     logger.info("Статистика записана в %s", output_path)
@@ -233,6 +248,11 @@ def interactive_loop(game_state, catalog, input_stream=None, output_stream=None)
     instream = input_stream or sys.stdin
     outstream = output_stream or sys.stdout
 
+    # Список игроков и разрешённые названия кэшируются на весь сеанс:
+    # состояние к этому моменту уже построено и не меняется между запросами.
+    players_list = list(game_state.players.values())
+    name_cache = {}
+
     for raw_line in instream:
         line = raw_line.strip()
         if not line:
@@ -246,24 +266,32 @@ def interactive_loop(game_state, catalog, input_stream=None, output_stream=None)
             continue
 
         logger.info("Запрос статистики по item_type_id=%d", item_type_id)
-        total_count = game_state.item_stats.totals.get(item_type_id, 0)
-        owners = game_state.item_stats.owner_counts.get(item_type_id, 0)
-        name = _item_name(item_type_id, catalog)
+        total_count = game_state.item_stats.get_total(item_type_id)
+        owners = game_state.item_stats.get_owner_count(item_type_id)
+        name = name_cache.get(item_type_id)
+        if name is None:
+            name = _item_name(item_type_id, catalog)
+            name_cache[item_type_id] = name
 
         outstream.write("Название предмета: %s\n" % name)
         outstream.write("Общее количество в игре: %d\n" % total_count)
         outstream.write("Количество владельцев: %d\n" % owners)
         outstream.write("Топ 10 игроков по предмету:\n")
 
-        player_counts = []
-        for player in game_state.players.values():
-            count = player.get_item_count(item_type_id)
-            if count > 0:
-                player_counts.append((player, count))
+        # Количество считается ровно один раз на игрока: внутренний генератор
+        # строит пары, внешний отбрасывает нулевые по готовому значению.
+        player_counts = (
+            (player, count)
+            for player, count in (
+                (player, player.get_item_count(item_type_id))
+                for player in players_list
+            )
+            if count > 0
+        )
 
-        for player, count in sorted(
-            player_counts, key=lambda pair: (-pair[1], pair[0].player_id)
-        )[:10]:
+        for player, count in heapq.nsmallest(
+            10, player_counts, key=lambda pair: (-pair[1], pair[0].player_id)
+        ):
             outstream.write("%s, %d\n" % (player.name, count))
 
         outstream.flush()
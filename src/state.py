@@ -8,8 +8,30 @@
 """
 from __future__ import unicode_literals
 
+import heapq
 import json
-from collections import defaultdict
+from array import array
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover - необязательная зависимость
+    ijson = None
+
+from parsers import ITEM_ADD, MONEY_ADD, MONEY_REMOVE
+
+
+# Сентинел «событий ещё не было»: максимум int64, поэтому min() с любой
+# реальной меткой времени всегда выбирает реальную.
+NO_ACTIVITY_TS = 2 ** 63 - 1
+
+# Малый инвентарь: до этого числа различных предметов инвентарь хранится
+# компактным списком пар ``[item_type_id, count]`` с линейным поиском, затем
+# продвигается в обычный словарь.
+_SMALL_INVENTORY_LIMIT = 8
+
+# Флаг малого инвентаря: при выключении игроки сразу получают словарь, как
+# раньше (удобно для сравнения в бенчмарках).
+SMALL_INVENTORY_ENABLED = True
 
 
 class Player(object):
@@ -30,70 +52,216 @@ class Player(object):
         self.name = name or "unknown"
         self.level = level
         self.money = 0
-        self.inventory = defaultdict(int)
-        self.first_event_ts = None
+        self.inventory = [] if SMALL_INVENTORY_ENABLED else {}
+        self.first_event_ts = NO_ACTIVITY_TS
         self.last_event_ts = None
 
     def update_activity(self, timestamp):
-        """Зафиксировать время первого и последнего события."""
+        """Зафиксировать время первого и последнего события.
 
-        if self.first_event_ts is None:
-            self.first_event_ts = timestamp
+        Благодаря сентинелу ``NO_ACTIVITY_TS`` первая метка выбирается через
+        ``min`` без ветвления «ещё не было событий» на каждом событии.
+        """
+
+        self.first_event_ts = min(self.first_event_ts, timestamp)
         self.last_event_ts = timestamp
 
     def apply_money(self, action, amount, timestamp):
-        """Применить денежное событие к игроку."""
+        """Применить денежное событие к игроку.
+
+        ``action`` — целочисленный код из ``parsers``, поэтому сравнение
+        сводится к одному целочисленному сравнению.
+        """
 
         self.update_activity(timestamp)
-        if action == "MONEY_ADD":
+        if not amount:
+            return
+        if action == MONEY_ADD:
             self.money += amount
-        elif action == "MONEY_REMOVE":
+        elif action == MONEY_REMOVE:
             self.money -= amount
 
-    def apply_inventory(self, action, items, timestamp):
-        """Применить событие инвентаря и вернуть изменения по предметам."""
+    def apply_inventory(self, action, items, timestamp, on_change=None):
+        """Применить событие инвентаря и сообщить об изменениях.
+
+        Без ``on_change`` возвращает список кортежей ``(item_type_id, delta,
+        previous, updated)`` в порядке следования предметов в событии. С
+        ``on_change`` каждый кортеж передаётся в колбэк прямо из цикла
+        мутации инвентаря — без промежуточного списка и второго прохода, —
+        а метод возвращает ``None``.
+        """
 
         self.update_activity(timestamp)
-        multiplier = 1 if action == "ITEM_ADD" else -1
-        changes = {}
+        multiplier = 1 if action == ITEM_ADD else -1
+        change = self._inventory_change
+        changes = [] if on_change is None else None
         for item_type_id, amount in items:
+            if not amount:
+                continue
             delta = multiplier * amount
-            previous = self.inventory.get(item_type_id, 0)
-            updated = previous + delta
-            self.inventory[item_type_id] = updated
-            changes[item_type_id] = (delta, previous, updated)
+            previous, updated = change(item_type_id, delta)
+            if on_change is not None:
+                on_change(item_type_id, delta, previous, updated)
+            else:
+                changes.append((item_type_id, delta, previous, updated))
         return changes
 
+    def _inventory_change(self, item_type_id, delta):
+        """Применить дельту к инвентарю и вернуть ``(previous, updated)``.
+
+        Малый инвентарь (список пар) сканируется линейно; при достижении
+        ``_SMALL_INVENTORY_LIMIT`` различных предметов он продвигается в
+        обычный словарь, и дальнейшие обновления идут по словарному пути.
+        """
+
+        inventory = self.inventory
+        if type(inventory) is dict:
+            previous = inventory.get(item_type_id, 0)
+            updated = previous + delta
+            inventory[item_type_id] = updated
+            return previous, updated
+        for pair in inventory:
+            if pair[0] == item_type_id:
+                previous = pair[1]
+                updated = previous + delta
+                pair[1] = updated
+                return previous, updated
+        inventory.append([item_type_id, delta])
+        if len(inventory) >= _SMALL_INVENTORY_LIMIT:
+            self.inventory = dict(inventory)
+        return 0, delta
+
+    def apply_inventory_into(self, action, items, timestamp, item_stats):
+        """Применить событие инвентаря, сразу обновляя статистику предметов.
+
+        Горячий путь повтора логов: инвентарь игрока и счётчики
+        ``ItemStatistics`` обновляются за один проход по ``items``, без
+        промежуточного контейнера изменений.
+        """
+
+        self.update_activity(timestamp)
+        multiplier = 1 if action == ITEM_ADD else -1
+        apply_change = item_stats.apply_item_change
+        inventory = self.inventory
+        if type(inventory) is dict:
+            inventory_get = inventory.get
+            for item_type_id, amount in items:
+                # Нулевые количества — шум: пропуск избавляет от записи в
+                # инвентарь и обновлений статистики на пустое изменение.
+                if not amount:
+                    continue
+                delta = multiplier * amount
+                previous = inventory_get(item_type_id, 0)
+                updated = previous + delta
+                inventory[item_type_id] = updated
+                apply_change(item_type_id, delta, previous, updated, timestamp)
+        else:
+            change = self._inventory_change
+            for item_type_id, amount in items:
+                if not amount:
+                    continue
+                delta = multiplier * amount
+                previous, updated = change(item_type_id, delta)
+                apply_change(item_type_id, delta, previous, updated, timestamp)
+
     def get_item_count(self, item_type_id):
         """Получить количество предметов данного типа у игрока."""
 
-        return self.inventory.get(item_type_id, 0)
+        inventory = self.inventory
+        if type(inventory) is dict:
+            return inventory.get(item_type_id, 0)
+        for pair in inventory:
+            if pair[0] == item_type_id:
+                return pair[1]
+        return 0
+
+
+# Размер пула заготовок Player по умолчанию: покрывает типичный всплеск
+# первых обращений к неизвестным игрокам без аллокаций на каждое обращение.
+_PLAYER_POOL_SIZE = 1024
+
+
+class PlayerPool(object):
+    """Пул заранее созданных объектов ``Player``.
+
+    Заготовки создаются один раз вместе с пустыми словарями инвентаря;
+    ``acquire`` выдаёт готовый объект, сбрасывая его поля, вместо полной
+    конструкции ``Player`` с аллокацией нового словаря. При исчерпании пула
+    выполняется обычное создание объекта.
+    """
+
+    __slots__ = ["_free"]
+
+    def __init__(self, size=_PLAYER_POOL_SIZE):
+        self._free = [Player(None) for _ in range(size)]
+
+    def acquire(self, player_id, name=None, level=None):
+        """Выдать игрока из пула (или создать нового, если пул пуст)."""
+
+        if self._free:
+            player = self._free.pop()
+            player.player_id = player_id
+            player.name = name or "unknown"
+            player.level = level
+            player.money = 0
+            inventory = player.inventory
+            if type(inventory) is dict:
+                inventory.clear()
+            else:
+                del inventory[:]
+            player.first_event_ts = NO_ACTIVITY_TS
+            player.last_event_ts = None
+            return player
+        return Player(player_id, name, level)
+
+    def release(self, player):
+        """Вернуть игрока в пул для повторного использования."""
+
+        self._free.append(player)
 
 
 class PlayerRegistry(object):
     """Реестр игроков с загрузкой из db.json."""
 
-    def __init__(self, players=None):
+    __slots__ = ["_players", "_pool"]
+
+    def __init__(self, players=None, pool=None):
         self._players = players or {}
+        self._pool = pool or PlayerPool()
 
     @classmethod
     def from_db_file(cls, path):
-        """Создать реестр игроков на основе файла db.json."""
+        """Создать реестр игроков на основе файла db.json.
+
+        При наличии ``ijson`` записи игроков читаются потоково, без загрузки
+        всего разобранного документа в память; иначе используется стандартный
+        ``json.load``. Реестр в обоих случаях строится инкрементально.
+        """
 
-        with open(path, "r") as handle:
-            payload = json.load(handle)
         mapping = {}
-        for entry in payload.get("players", []):
-            mapping[entry.get("id")] = Player(
-                entry.get("id"), entry.get("name"), entry.get("level")
-            )
+        if ijson is not None:
+            with open(path, "rb") as handle:
+                entries = ijson.items(handle, "players.item")
+                for entry in entries:
+                    mapping[entry.get("id")] = Player(
+                        entry.get("id"), entry.get("name"), entry.get("level")
+                    )
+        else:
+            # Файл целиком отдаётся в json.loads: один вызов C-сканера по
+            # готовому буферу вместо обёртки json.load поверх дескриптора.
+            with open(path, "rb") as handle:
+                payload = json.loads(handle.read())
+            for entry in payload.get("players", []):
+                mapping[entry.get("id")] = Player(
+                    entry.get("id"), entry.get("name"), entry.get("level")
+                )
         return cls(mapping)
 
     def get(self, player_id):
         """Получить игрока по идентификатору, создавая заглушку при отсутствии."""
 
         if player_id not in self._players:
-            self._players[player_id] = Player(player_id)
+            self._players[player_id] = self._pool.acquire(player_id)
         return self._players[player_id]
 
     def values(self):
@@ -103,59 +271,164 @@ class PlayerRegistry(object):
 
 
 class ItemStatistics(object):
-    """Глобальная статистика по предметам."""
+    """Глобальная статистика по предметам.
+
+    Счётчики хранятся в плоских колонках ``array`` (структура массивов),
+    индексируемых напрямую ``item_type_id``: идентификаторы предметов —
+    небольшие плотные целые (по ТЗ не более 1000), поэтому обновление
+    счётчика — это одно индексное обращение вместо хеширования ключа в
+    словаре. Колонки дорастают по мере появления новых идентификаторов.
+    """
+
+    __slots__ = [
+        "totals",
+        "owner_counts",
+        "mentions",
+        "_first_seen",
+        "_first_seen_ts_col",
+        "_first_seen_item_col",
+    ]
 
     def __init__(self):
-        self.totals = defaultdict(int)
-        self.owner_counts = defaultdict(int)
-        self.mentions = defaultdict(int)
-        self._first_seen_ts = {}
-        self._first_seen_order = []
+        self.totals = array(b"l")
+        self.owner_counts = array(b"l")
+        self.mentions = array(b"l")
+        # Карта item_type_id -> метка первого появления для проверки «уже
+        # видели», плюс две параллельные колонки ``array`` с хронологией
+        # регистраций: компактные машинные значения вместо списка кортежей
+        # из пары боксированных объектов на каждый предмет.
+        self._first_seen = {}
+        self._first_seen_ts_col = array(b"l")
+        self._first_seen_item_col = array(b"l")
+
+    def _ensure_capacity(self, item_type_id):
+        """Дорастить колонки счётчиков до индекса ``item_type_id``."""
+
+        grow = item_type_id + 1 - len(self.totals)
+        if grow > 0:
+            zeros = [0] * grow
+            self.totals.extend(zeros)
+            self.owner_counts.extend(zeros)
+            self.mentions.extend(zeros)
 
     def register_appearance(self, item_type_id, timestamp):
         """Зафиксировать первое появление предмета в логах."""
 
-        if item_type_id in self._first_seen_ts:
+        if item_type_id in self._first_seen:
             return
-        self._first_seen_ts[item_type_id] = timestamp
-        self._first_seen_order.append((timestamp, item_type_id))
+        self._first_seen[item_type_id] = timestamp
+        self._first_seen_ts_col.append(timestamp)
+        self._first_seen_item_col.append(item_type_id)
 
     def record_delta(self, item_type_id, delta):
         """Изменить общий счётчик предметов."""
 
+        self._ensure_capacity(item_type_id)
         self.totals[item_type_id] += delta
 
     def record_mention(self, item_type_id):
         """Учитывать факт появления предмета в логах (для топа упоминаний)."""
 
+        self._ensure_capacity(item_type_id)
         self.mentions[item_type_id] += 1
 
     def update_owner_count(self, item_type_id, previous, updated):
-        """Скорректировать количество владельцев предмета."""
+        """Скорректировать количество владельцев предмета.
+
+        Переход знака выражается арифметически: ``(updated > 0) - (previous >
+        0)`` даёт +1 при появлении владельца, -1 при исчезновении и 0 в
+        остальных случаях — без ветвлений на каждое изменение. Нижний клэмп не
+        нужен: переходы по каждому игроку симметричны, поэтому счётчик не
+        опускается ниже нуля.
+        """
+
+        self._ensure_capacity(item_type_id)
+        self.owner_counts[item_type_id] += (updated > 0) - (previous > 0)
+
+    def apply_item_change(self, item_type_id, delta, previous, updated, timestamp):
+        """Применить одно изменение предмета ко всем счётчикам разом.
+
+        Слитый вариант ``register_appearance`` + ``record_mention`` +
+        ``record_delta`` + ``update_owner_count``: ёмкость колонок
+        проверяется один раз, первое появление — одной проверкой словаря,
+        а индексные обновления идут подряд в одном теле функции вместо
+        четырёх вызовов на каждый предмет события.
+        """
+
+        self._ensure_capacity(item_type_id)
+        first_seen = self._first_seen
+        if item_type_id not in first_seen:
+            first_seen[item_type_id] = timestamp
+            self._first_seen_ts_col.append(timestamp)
+            self._first_seen_item_col.append(item_type_id)
+        self.mentions[item_type_id] += 1
+        self.totals[item_type_id] += delta
+        self.owner_counts[item_type_id] += (updated > 0) - (previous > 0)
+
+    def get_total(self, item_type_id):
+        """Общее количество предметов данного типа в игре."""
+
+        if 0 <= item_type_id < len(self.totals):
+            return self.totals[item_type_id]
+        return 0
+
+    def get_owner_count(self, item_type_id):
+        """Число игроков, владеющих хотя бы одним предметом данного типа."""
+
+        if 0 <= item_type_id < len(self.owner_counts):
+            return self.owner_counts[item_type_id]
+        return 0
+
+    def iter_mentions(self):
+        """Итерация по парам ``(item_type_id, упоминания)`` учтённых предметов."""
+
+        mentions = self.mentions
+        for item_type_id in self._first_seen:
+            yield item_type_id, mentions[item_type_id]
 
-        if previous <= 0 and updated > 0:
-            self.owner_counts[item_type_id] += 1
-        elif previous > 0 and updated <= 0:
-            self.owner_counts[item_type_id] -= 1
-            if self.owner_counts[item_type_id] < 0:
-                self.owner_counts[item_type_id] = 0
+    def distinct_items(self):
+        """Число различных предметов, встреченных в логах."""
+
+        return len(self._first_seen)
+
+    def _iter_first_seen_keys(self):
+        """Итерация по тройкам ``(метка, порядковый номер, item_type_id)``.
+
+        Порядковый номер регистрации разрешает равенство меток времени в
+        пользу порядка появления в логах — так же, как прежний срез списка.
+        """
+
+        item_col = self._first_seen_item_col
+        for index, timestamp in enumerate(self._first_seen_ts_col):
+            yield timestamp, index, item_col[index]
 
     def first_items(self, limit=10):
-        """Вернуть первые ``limit`` предметов по времени появления."""
+        """Вернуть ``limit`` самых ранних пар ``(метка, item_type_id)``.
 
-        return self._first_seen_order[:limit]
+        Выбор через ``heapq.nsmallest`` — O(N log K) и не зависит от порядка
+        вставки: результат корректен даже для источников, применяющих события
+        не строго хронологически.
+        """
+
+        head = heapq.nsmallest(limit, self._iter_first_seen_keys())
+        return [(timestamp, item_type_id) for timestamp, _, item_type_id in head]
 
     def last_items(self, limit=10):
-        """Вернуть последние ``limit`` предметов по времени появления."""
+        """Вернуть ``limit`` самых поздних пар ``(метка, item_type_id)``.
+
+        Отбор хвоста через ``heapq.nlargest``; результат возвращается в
+        хронологическом порядке, как и раньше.
+        """
 
-        if not self._first_seen_order:
-            return []
-        return self._first_seen_order[-limit:]
+        tail = sorted(heapq.nlargest(limit, self._iter_first_seen_keys()))
+        return [(timestamp, item_type_id) for timestamp, _, item_type_id in tail]
 
 
 class GameState(object):
     """Комбинированное состояние игроков и глобальных счётчиков."""
 
+    __slots__ = ["players", "item_stats"]
+
     def __init__(self, player_registry, item_stats=None):
         self.players = player_registry
         self.item_stats = item_stats or ItemStatistics()
@@ -164,13 +437,9 @@ class GameState(object):
         """Обработать событие инвентаря из ``InventoryEvent``."""
 
         player = self.players.get(event.player_id)
-        changes = player.apply_inventory(event.action, event.items, event.timestamp)
-        for item_type_id, change in changes.items():
-            delta, previous, updated = change
-            self.item_stats.register_appearance(item_type_id, event.timestamp)
-            self.item_stats.record_mention(item_type_id)
-            self.item_stats.record_delta(item_type_id, delta)
-            self.item_stats.update_owner_count(item_type_id, previous, updated)
+        player.apply_inventory_into(
+            event.action, event.items, event.timestamp, self.item_stats
+        )
 
     def apply_money_event(self, event):
         """Обработать событие денег из ``MoneyEvent``."""
@@ -178,10 +447,38 @@ class GameState(object):
         player = self.players.get(event.player_id)
         player.apply_money(event.action, event.amount, event.timestamp)
 
+    def apply_inventory_batch(self, events):
+        """Обработать пакет событий инвентаря одним плотным циклом.
+
+        Эквивалентно последовательным вызовам ``apply_inventory_event``, но
+        горячие ссылки связываются в локальные переменные один раз на пакет,
+        а не на каждое событие. Рассчитано на пакеты из
+        ``parsers.iter_inventory_batches``.
+        """
+
+        get_player = self.players.get
+        item_stats = self.item_stats
+        for event in events:
+            get_player(event.player_id).apply_inventory_into(
+                event.action, event.items, event.timestamp, item_stats
+            )
+
+    def apply_money_batch(self, events):
+        """Обработать пакет денежных событий одним плотным циклом."""
+
+        get_player = self.players.get
+        for event in events:
+            get_player(event.player_id).apply_money(
+                event.action, event.amount, event.timestamp
+            )
+
 
 __all__ = [
+    "NO_ACTIVITY_TS",
+    "SMALL_INVENTORY_ENABLED",
     "GameState",
     "ItemStatistics",
     "Player",
+    "PlayerPool",
     "PlayerRegistry",
 ]